@@ -0,0 +1,172 @@
+# api/app/core/admission.py
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+from api.app.core.settings import settings
+
+T = TypeVar("T")
+
+# Job signature: fn(cancel_event, deadline) -> result
+# deadline is a time.monotonic() timestamp; the job should stop early once
+# cancel_event is set or the deadline has passed.
+Job = Callable[[threading.Event, float], T]
+
+
+class ModelGate:
+    """
+    Admission control for one shared model.
+
+    - at most `max_concurrency` jobs run at once
+    - at most `max_queue` requests wait behind them
+    - everything else is rejected immediately with 429 + Retry-After
+    - running jobs are cancelled on client disconnect or deadline
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, poll_s: float = 0.5):
+        self.name = name
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.poll_s = float(poll_s)
+
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self._admitted = 0  # running + waiting; counted before any await
+        self._avg_s: Optional[float] = None  # EWMA of job wall time
+
+    def _retry_after(self) -> int:
+        if self._avg_s is None:
+            return 1
+        waiting = max(0, self._admitted - self.max_concurrency)
+        return max(1, math.ceil(self._avg_s * (waiting + 1) / self.max_concurrency))
+
+    def _record(self, elapsed_s: float) -> None:
+        self._avg_s = elapsed_s if self._avg_s is None else 0.8 * self._avg_s + 0.2 * elapsed_s
+
+    def _finish(self, started: float, job: Optional[asyncio.Future] = None) -> None:
+        if job is not None and not job.cancelled():
+            job.exception()  # mark retrieved; the caller is gone
+        self._record(time.monotonic() - started)
+        self._admitted -= 1
+        self._sem.release()
+
+    async def _acquire(self, deadline: float) -> bool:
+        """Wait for a permit until the deadline. Never leaks a permit on timeout/cancel."""
+        acq = asyncio.ensure_future(self._sem.acquire())
+        try:
+            await asyncio.wait({acq}, timeout=max(0.0, deadline - time.monotonic()))
+        finally:
+            if not acq.done():
+                acq.cancel()
+                # Granted after we gave up (or while being cancelled): hand it back.
+                acq.add_done_callback(lambda f: f.cancelled() or f.exception() or self._sem.release())
+        return acq.done() and not acq.cancelled()
+
+    def _busy(self) -> HTTPException:
+        return HTTPException(
+            status_code=429,
+            detail=f"{self.name} is busy, try again later",
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    async def run(self, request: Request, fn: Job, *, timeout_s: float) -> T:
+        deadline = time.monotonic() + float(timeout_s)
+
+        # ---- Admission (synchronous: a burst in one loop tick is counted exactly) ----
+        if self._admitted >= self.max_concurrency + self.max_queue:
+            raise self._busy()
+
+        self._admitted += 1
+        acquired = False
+        try:
+            acquired = await self._acquire(deadline)
+        finally:
+            if not acquired:
+                self._admitted -= 1
+        if not acquired:
+            raise HTTPException(
+                status_code=503,
+                detail=f"{self.name} queue wait exceeded deadline",
+                headers={"Retry-After": str(self._retry_after())},
+            )
+
+        # ---- Run (slot held until the worker thread actually finishes) ----
+        cancel = threading.Event()
+        timed_out = False
+        disconnected = False
+        started = time.monotonic()
+        handed_off = False  # slot release moved to the job's done-callback
+
+        try:
+            if await request.is_disconnected():
+                raise HTTPException(status_code=499, detail="client closed request")
+
+            job = asyncio.ensure_future(run_in_threadpool(fn, cancel, deadline))
+            try:
+                while True:
+                    done, _ = await asyncio.wait({job}, timeout=self.poll_s)
+                    if done:
+                        break
+                    if cancel.is_set():
+                        continue
+                    if time.monotonic() >= deadline:
+                        timed_out = True
+                        cancel.set()
+                    elif await request.is_disconnected():
+                        disconnected = True
+                        cancel.set()
+            except asyncio.CancelledError:
+                # Handler cancelled (e.g. shutdown) but the thread is still on the
+                # shared model: keep the permit until it really finishes.
+                cancel.set()
+                handed_off = True
+                job.add_done_callback(lambda f: self._finish(started, f))
+                raise
+
+            # The job may have stopped itself at the deadline (stopping criteria /
+            # GenerationCancelled from the diffusion callback) before we noticed.
+            timed_out = timed_out or time.monotonic() >= deadline
+
+            try:
+                result = job.result()
+            except Exception:
+                # A cancelled or timed-out job may surface as an exception from the
+                # model code (GenerationCancelled, or a RuntimeError from the model server).
+                if not (cancel.is_set() or timed_out):
+                    raise
+                result = None
+        finally:
+            if not handed_off:
+                self._finish(started)
+
+        if timed_out:
+            raise HTTPException(status_code=504, detail=f"{self.name} exceeded {timeout_s:g}s deadline")
+        if disconnected:
+            raise HTTPException(status_code=499, detail="client closed request")
+
+        return result
+
+
+# With a model server the server owns the model and batches across requests,
+# so each API worker may keep several /chat calls in flight to it.
+LLM_GATE = ModelGate(
+    "llm",
+    max(settings.llm_max_concurrency, settings.llm_server_max_inflight)
+    if settings.llm_server
+    else settings.llm_max_concurrency,
+    settings.llm_max_queue,
+    poll_s=settings.disconnect_poll_s,
+)
+
+DIFFUSION_GATE = ModelGate(
+    "diffusion",
+    settings.diffusion_max_concurrency,
+    settings.diffusion_max_queue,
+    poll_s=settings.disconnect_poll_s,
+)
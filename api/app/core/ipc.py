@@ -0,0 +1,165 @@
+# api/app/core/ipc.py
+"""
+Local IPC between API workers and the model server (api/app/model_server.py).
+
+Transport is multiprocessing.connection over 127.0.0.1 with an authkey
+(works the same on Windows and Linux). Messages are tuples:
+
+  client -> server   ("call",   req_id, op, kwargs, timeout_s)
+                     ("cancel", req_id)
+  server -> client   ("ok",     req_id, result)
+                     ("error",  req_id, exc_type, message)
+
+One connection per API worker carries many in-flight requests; replies are
+matched back to callers by req_id.
+"""
+from __future__ import annotations
+
+import os
+import itertools
+import secrets
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+# Exceptions the server may send back that callers handle by type.
+_REMOTE_ERRORS = {
+    "KeyError": KeyError,
+    "ValueError": ValueError,
+}
+
+
+# Messages are pickles, so the authkey is the only thing between a local user
+# and code execution in the model process. Without SYM_API_MODEL_SERVER_AUTHKEY
+# the server generates a random key into this user-only file and clients read it.
+AUTHKEY_FILE = Path(os.environ.get("SYM_MODEL_SERVER_KEY_FILE", str(Path.home() / ".symoneural" / "model_server.key")))
+
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "::1"}
+
+
+def load_authkey(configured: str, *, create: bool = False) -> bytes:
+    """
+    configured (settings.model_server_authkey) wins; otherwise read AUTHKEY_FILE,
+    generating it (mode 0600) when create=True. Raises ConnectionError if no key.
+    """
+    if configured:
+        return configured.encode()
+    if AUTHKEY_FILE.exists():
+        return AUTHKEY_FILE.read_text(encoding="utf-8").strip().encode()
+    if not create:
+        raise ConnectionError(
+            f"no model server authkey: set SYM_API_MODEL_SERVER_AUTHKEY or start the server to create {AUTHKEY_FILE}"
+        )
+
+    AUTHKEY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    key = secrets.token_hex(32)
+    fd = os.open(str(AUTHKEY_FILE), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(key)
+    return key.encode()
+
+
+def parse_address(addr: str) -> Tuple[str, int]:
+    host, _, port = addr.strip().rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+class ModelClient:
+    """Multiplexed client for one model server address. Thread-safe."""
+
+    def __init__(self, address: str, authkey: bytes, poll_s: float = 0.2):
+        self.address = address
+        self.authkey = authkey
+        self.poll_s = poll_s
+
+        self._conn: Optional[Connection] = None
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def _connect(self) -> Connection:
+        # Caller holds _send_lock.
+        if self._conn is None:
+            try:
+                self._conn = Client(parse_address(self.address), authkey=self.authkey)
+            except AuthenticationError as e:
+                raise ConnectionError(f"model server {self.address} rejected the authkey") from e
+            threading.Thread(target=self._reader, args=(self._conn,), daemon=True).start()
+        return self._conn
+
+    def _reader(self, conn: Connection) -> None:
+        try:
+            while True:
+                msg = conn.recv()
+                with self._pending_lock:
+                    fut = self._pending.pop(msg[1], None)
+                if fut is None:
+                    continue
+                if msg[0] == "ok":
+                    fut.set_result(msg[2])
+                else:
+                    exc_type = _REMOTE_ERRORS.get(msg[2], RuntimeError)
+                    fut.set_exception(exc_type(msg[3]))
+        except (EOFError, OSError):
+            pass
+
+        # Connection lost: fail everything in flight; next call reconnects.
+        with self._send_lock:
+            if self._conn is conn:
+                self._conn = None
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for fut in pending.values():
+            fut.set_exception(ConnectionError(f"model server {self.address} disconnected"))
+
+    def _send(self, msg: tuple) -> None:
+        with self._send_lock:
+            self._connect().send(msg)
+
+    def call(
+        self,
+        op: str,
+        kwargs: Dict[str, Any],
+        *,
+        cancel_event: Optional[threading.Event] = None,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """Blocking call. Forwards cancel_event to the server as a cancel message."""
+        req_id = next(self._ids)
+        fut: Future = Future()
+        with self._pending_lock:
+            self._pending[req_id] = fut
+
+        timeout_s = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            self._send(("call", req_id, op, kwargs, timeout_s))
+        except Exception:
+            with self._pending_lock:
+                self._pending.pop(req_id, None)
+            raise
+
+        cancelled = False
+        while True:
+            try:
+                return fut.result(timeout=self.poll_s)
+            except FutureTimeout:
+                if not cancelled and cancel_event is not None and cancel_event.is_set():
+                    cancelled = True
+                    self._send(("cancel", req_id))
+
+
+_CLIENTS: Dict[str, ModelClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(address: str, configured_authkey: str) -> ModelClient:
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(address)
+        if client is None:
+            client = _CLIENTS[address] = ModelClient(address, load_authkey(configured_authkey))
+        return client
@@ -4,4 +4,32 @@ class Settings(BaseSettings):
     app_name: str = "SyMoNeuRaL API"
     debug: bool = True
 
-settings = Settings()
\ No newline at end of file
+    # ---- Admission control (per model) ----
+    # Jobs running at once on the shared model, and how many may wait behind them.
+    # Anything past that gets a fast 429 + Retry-After instead of piling onto the CPU.
+    llm_max_concurrency: int = 1
+    llm_max_queue: int = 4
+    llm_timeout_s: float = 120.0
+
+    diffusion_max_concurrency: int = 1
+    diffusion_max_queue: int = 2
+    diffusion_timeout_s: float = 300.0
+
+    # How often a running job checks for client disconnect / deadline.
+    disconnect_poll_s: float = 0.5
+
+    # ---- Out-of-process model server (api/app/model_server.py) ----
+    # "host:port" of a running model server; empty = load the model in this process.
+    llm_server: str = ""
+    diffusion_server: str = ""
+    # Shared secret for the pickle-based IPC. Empty = use the per-user key file
+    # the server generates (see api/app/core/ipc.py); there is no built-in default.
+    model_server_authkey: str = ""
+    # /chat requests one API worker may have in flight to the server; the server
+    # batches across them, so this should match its --max-batch.
+    llm_server_max_inflight: int = 4
+
+    class Config:
+        env_prefix = "SYM_API_"
+
+settings = Settings()
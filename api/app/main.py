@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
@@ -18,6 +19,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Model server (SYM_API_*_SERVER) down or unreachable: retryable, not a 500.
+@app.exception_handler(ConnectionError)
+async def model_server_unavailable(request: Request, exc: ConnectionError):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"model server unavailable: {exc}"},
+        headers={"Retry-After": "5"},
+    )
+
 # ---- API routes FIRST (critical) ----
 app.include_router(health_router)
 app.include_router(chat_router)
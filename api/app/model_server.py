@@ -0,0 +1,322 @@
+# api/app/model_server.py
+"""
+Dedicated model process shared by any number of API workers.
+
+  python -m api.app.model_server --models llm,diffusion --port 8765
+
+Then point the API at it (every uvicorn/gunicorn worker connects to it
+instead of loading its own copy of the models):
+
+  SYM_API_LLM_SERVER=127.0.0.1:8765
+  SYM_API_DIFFUSION_SERVER=127.0.0.1:8765
+
+Run one process per model (different ports) to scale them independently.
+Plain /chat requests waiting in the queue with the same generation
+settings are batched into one generate() call. Speculative decoding
+(SYM_DRAFT_MODEL) only applies when a request runs alone; batched
+requests decode without the draft model.
+
+The IPC carries pickles: the server only binds to loopback unless
+--allow-remote is given, and needs SYM_API_MODEL_SERVER_AUTHKEY or
+generates a random key into a user-only file (api/app/core/ipc.py).
+"""
+from __future__ import annotations
+
+import argparse
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from typing import Any, Callable, Dict, List, Optional
+
+from api.app.core.ipc import LOOPBACK_HOSTS, load_authkey, parse_address
+from api.app.core.settings import settings
+
+
+class _Request:
+    def __init__(self, peer: "_Peer", req_id: int, op: str, kwargs: Dict[str, Any], timeout_s: Optional[float]):
+        self.peer = peer
+        self.req_id = req_id
+        self.op = op
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+        self.deadline = None if timeout_s is None else time.monotonic() + timeout_s
+
+    def reply(self, result: Any) -> None:
+        self.peer.send(("ok", self.req_id, result))
+
+    def fail(self, exc: BaseException) -> None:
+        self.peer.send(("error", self.req_id, type(exc).__name__, str(exc)))
+
+
+class _Peer:
+    """One API worker connection; reads requests, serialises replies."""
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.inflight: Dict[int, _Request] = {}
+
+    def send(self, msg: tuple) -> None:
+        with self.lock:
+            try:
+                self.conn.send(msg)
+            except (OSError, EOFError):
+                pass  # worker went away; its requests are cancelled by the reader
+
+
+# ---------- Model handlers (run on the model's dispatcher thread) ----------
+
+def _llm_batch(reqs: List[_Request]) -> None:
+    from bot.infer_lora import run_inference, run_inference_batch
+
+    gen = reqs[0].kwargs.get("gen", {})
+    if len(reqs) == 1:
+        # Alone: the regular path, which honours SYM_DRAFT_MODEL.
+        r = reqs[0]
+        r.reply(run_inference(r.kwargs["prompt"], cancel_event=r.cancel_event, deadline=r.deadline, **gen))
+        return
+
+    replies = run_inference_batch(
+        [r.kwargs["prompt"] for r in reqs],
+        cancel_events=[r.cancel_event for r in reqs],
+        deadlines=[r.deadline for r in reqs],
+        **gen,
+    )
+    for r, text in zip(reqs, replies):
+        r.reply(text)
+
+
+def _llm_single(req: _Request) -> Any:
+    from bot import chat_sessions
+
+    kw = req.kwargs
+    if req.op == "session_message":
+        return chat_sessions.send_message(
+            kw["session_id"], kw["prompt"], cancel_event=req.cancel_event, deadline=req.deadline
+        )
+    raise ValueError(f"unknown op: {req.op}")
+
+
+def _diffusion_single(req: _Request) -> Any:
+    from diffusion.pipeline import generate_image
+
+    if req.op != "image":
+        raise ValueError(f"unknown op: {req.op}")
+    return generate_image(req.kwargs["prompt"], cancel_event=req.cancel_event, deadline=req.deadline)
+
+
+class _ModelWorker:
+    """
+    One model replica: a queue plus a dispatcher thread. Requests for the
+    batchable op are coalesced (same generation settings, up to max_batch,
+    waiting at most batch_wait_s for company).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        single: Callable[[_Request], Any],
+        batch: Optional[Callable[[List[_Request]], None]] = None,
+        batch_op: str = "",
+        max_batch: int = 1,
+        batch_wait_s: float = 0.0,
+    ):
+        self.name = name
+        self.single = single
+        self.batch = batch
+        self.batch_op = batch_op
+        self.max_batch = max(1, max_batch)
+        self.batch_wait_s = batch_wait_s
+        self.queue: "queue.Queue[_Request]" = queue.Queue()
+        self._held: List[_Request] = []  # pulled while batching but not compatible
+        threading.Thread(target=self._loop, name=f"model-{name}", daemon=True).start()
+
+    def _next(self, timeout: Optional[float] = None) -> Optional[_Request]:
+        if self._held:
+            return self._held.pop(0)
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _loop(self) -> None:
+        while True:
+            req = self._next()
+            if req.cancel_event.is_set():
+                req.fail(RuntimeError("cancelled before start"))
+                req.peer.inflight.pop(req.req_id, None)
+                continue
+
+            if self.batch is None or req.op != self.batch_op:
+                self._run_single(req)
+                continue
+
+            group = [req]
+            key = repr(sorted(req.kwargs.get("gen", {}).items()))
+            until = time.monotonic() + self.batch_wait_s
+            held: List[_Request] = []
+            while len(group) < self.max_batch:
+                nxt = self._next(timeout=max(0.0, until - time.monotonic()))
+                if nxt is None:
+                    break
+                if nxt.op == self.batch_op and repr(sorted(nxt.kwargs.get("gen", {}).items())) == key:
+                    group.append(nxt)
+                else:
+                    held.append(nxt)
+            self._held = held + self._held
+
+            try:
+                self.batch(group)
+            except Exception as e:
+                for r in group:
+                    r.fail(e)
+            finally:
+                for r in group:
+                    r.peer.inflight.pop(r.req_id, None)
+
+    def _run_single(self, req: _Request) -> None:
+        try:
+            req.reply(self.single(req))
+        except Exception as e:
+            req.fail(e)
+        finally:
+            req.peer.inflight.pop(req.req_id, None)
+
+
+_OPS = {
+    "chat": "llm",
+    "session_message": "llm",
+    "image": "diffusion",
+}
+
+
+def _session_op(op: str, kwargs: Dict[str, Any]) -> Any:
+    """Cheap session bookkeeping: answered on the peer thread, never queued behind generation."""
+    from bot import chat_sessions
+
+    if op == "session_create":
+        return chat_sessions.create_session()
+    if op == "session_close":
+        return chat_sessions.close_session(kwargs["session_id"])
+    return chat_sessions.get_history(kwargs["session_id"])
+
+
+_INLINE_OPS = {"session_create", "session_close", "session_history"}
+
+_HANDSHAKE_TIMEOUT_S = 5.0
+
+
+class _HandshakeConn:
+    """Connection view for the authkey handshake: recv_bytes gives up after timeout_s."""
+
+    def __init__(self, conn: Connection, timeout_s: float):
+        self.conn = conn
+        self.until = time.monotonic() + timeout_s
+
+    def send_bytes(self, buf) -> None:
+        self.conn.send_bytes(buf)
+
+    def recv_bytes(self, maxlength: Optional[int] = None) -> bytes:
+        if not self.conn.poll(max(0.0, self.until - time.monotonic())):
+            raise TimeoutError("authkey handshake timed out")
+        return self.conn.recv_bytes(maxlength)
+
+
+def _handshake(conn: Connection, authkey: bytes, timeout_s: float) -> bool:
+    """Server side of Listener(authkey=...)'s handshake, run on the peer's own thread."""
+    hs = _HandshakeConn(conn, timeout_s)
+    try:
+        deliver_challenge(hs, authkey)
+        answer_challenge(hs, authkey)
+        return True
+    except (AuthenticationError, EOFError, OSError) as e:  # TimeoutError is an OSError
+        print(f"[!] Rejected connection: {type(e).__name__}: {e}")
+        conn.close()
+        return False
+
+
+def _serve_peer(conn: Connection, authkey: bytes, workers: Dict[str, _ModelWorker]) -> None:
+    if not _handshake(conn, authkey, _HANDSHAKE_TIMEOUT_S):
+        return
+    peer = _Peer(conn)
+    try:
+        while True:
+            msg = peer.conn.recv()
+            if msg[0] == "cancel":
+                req = peer.inflight.get(msg[1])
+                if req is not None:
+                    req.cancel_event.set()
+                continue
+
+            _, req_id, op, kwargs, timeout_s = msg
+            req = _Request(peer, req_id, op, kwargs, timeout_s)
+            if op in _INLINE_OPS and "llm" in workers:
+                try:
+                    req.reply(_session_op(op, kwargs))
+                except Exception as e:
+                    req.fail(e)
+                continue
+            worker = workers.get(_OPS.get(op, ""))
+            if worker is None:
+                req.fail(ValueError(f"op {op!r} not served by this process"))
+                continue
+            peer.inflight[req_id] = req
+            worker.queue.put(req)
+    except (EOFError, OSError):
+        pass
+
+    # API worker gone: stop whatever it still had running or queued.
+    for req in list(peer.inflight.values()):
+        req.cancel_event.set()
+    peer.conn.close()
+
+
+def serve(address: str, models: List[str], max_batch: int, batch_wait_s: float) -> None:
+    workers: Dict[str, _ModelWorker] = {}
+    if "llm" in models:
+        workers["llm"] = _ModelWorker(
+            "llm", _llm_single, _llm_batch, batch_op="chat", max_batch=max_batch, batch_wait_s=batch_wait_s
+        )
+    if "diffusion" in models:
+        workers["diffusion"] = _ModelWorker("diffusion", _diffusion_single)
+
+    authkey = load_authkey(settings.model_server_authkey, create=True)
+    # No authkey on the Listener: accept() would run the handshake on this thread,
+    # and one client that never answers would block every later connection.
+    listener = Listener(parse_address(address))
+    print(f"[+] Model server on {address} serving: {', '.join(workers)}")
+
+    while True:
+        try:
+            conn = listener.accept()
+        except OSError as e:
+            print(f"[!] Accept failed: {e}")
+            continue
+        threading.Thread(target=_serve_peer, args=(conn, authkey, workers), daemon=True).start()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--models", default="llm,diffusion", help="comma list: llm,diffusion")
+    ap.add_argument("--max-batch", type=int, default=4)
+    ap.add_argument("--batch-wait-ms", type=float, default=20.0)
+    ap.add_argument(
+        "--allow-remote",
+        action="store_true",
+        help="allow binding a non-loopback host (the IPC carries pickles; trusted networks only)",
+    )
+    args = ap.parse_args()
+
+    if args.host not in LOOPBACK_HOSTS and not args.allow_remote:
+        raise SystemExit(f"Refusing to bind {args.host}: loopback only unless --allow-remote is given")
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    serve(f"{args.host}:{args.port}", models, args.max_batch, args.batch_wait_ms / 1000.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,59 @@
-from fastapi import APIRouter
-from api.app.services.bot_service import generate_text
+from fastapi import APIRouter, HTTPException, Request
+
+from api.app.core.admission import LLM_GATE
+from api.app.core.settings import settings
+from api.app.services.bot_service import (
+    chat_session_history,
+    close_chat_session,
+    create_chat_session,
+    generate_text,
+    send_chat_message,
+)
 
 router = APIRouter()
 
 @router.post("/chat")
-def chat(prompt: str):
-    response = generate_text(prompt)
-    return {"response": response}
\ No newline at end of file
+async def chat(prompt: str, request: Request):
+    response = await LLM_GATE.run(
+        request,
+        lambda cancel, deadline: generate_text(prompt, cancel_event=cancel, deadline=deadline),
+        timeout_s=settings.llm_timeout_s,
+    )
+    return {"response": response}
+
+# ---- Multi-turn sessions (history + retained KV cache) ----
+
+@router.post("/chat/sessions")
+def create_session():
+    return {"session_id": create_chat_session()}
+
+@router.get("/chat/sessions/{session_id}")
+def get_session(session_id: str):
+    try:
+        return {"session_id": session_id, "messages": chat_session_history(session_id)}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="unknown session")
+
+@router.delete("/chat/sessions/{session_id}")
+def delete_session(session_id: str):
+    try:
+        close_chat_session(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="unknown session")
+    return {"session_id": session_id, "closed": True}
+
+@router.post("/chat/sessions/{session_id}/messages")
+async def session_message(session_id: str, prompt: str, request: Request):
+    try:
+        result = await LLM_GATE.run(
+            request,
+            lambda cancel, deadline: send_chat_message(
+                session_id, prompt, cancel_event=cancel, deadline=deadline
+            ),
+            timeout_s=settings.llm_timeout_s,
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="unknown session")
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"session_id": session_id, **result}
@@ -1,9 +1,16 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+
+from api.app.core.admission import DIFFUSION_GATE
+from api.app.core.settings import settings
 from api.app.services.diffusion_service import generate_image_from_prompt
 
 router = APIRouter()
 
 @router.post("/image")
-def image(prompt: str):
-    path = generate_image_from_prompt(prompt)
-    return {"image_path": path}
\ No newline at end of file
+async def image(prompt: str, request: Request):
+    path = await DIFFUSION_GATE.run(
+        request,
+        lambda cancel, deadline: generate_image_from_prompt(prompt, cancel_event=cancel, deadline=deadline),
+        timeout_s=settings.diffusion_timeout_s,
+    )
+    return {"image_path": path}
@@ -1,5 +1,70 @@
 # api/app/services/bot_service.py
-from bot.infer_lora import run_inference
+import threading
+from typing import Dict, List, Optional
 
-def generate_text(prompt: str) -> str:
-    return run_inference(prompt)
\ No newline at end of file
+from api.app.core.ipc import get_client
+from api.app.core.settings import settings
+
+# With SYM_API_LLM_SERVER set, every call goes to the shared model server and
+# this worker never imports torch/transformers or loads the model itself.
+
+def _remote():
+    if not settings.llm_server:
+        return None
+    return get_client(settings.llm_server, settings.model_server_authkey)
+
+def generate_text(
+    prompt: str,
+    *,
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+) -> str:
+    client = _remote()
+    if client is not None:
+        return client.call("chat", {"prompt": prompt}, cancel_event=cancel_event, deadline=deadline)
+
+    from bot.infer_lora import run_inference
+    return run_inference(prompt, cancel_event=cancel_event, deadline=deadline)
+
+def create_chat_session() -> str:
+    client = _remote()
+    if client is not None:
+        return client.call("session_create", {})
+
+    from bot import chat_sessions
+    return chat_sessions.create_session()
+
+def close_chat_session(session_id: str) -> None:
+    client = _remote()
+    if client is not None:
+        return client.call("session_close", {"session_id": session_id})
+
+    from bot import chat_sessions
+    chat_sessions.close_session(session_id)
+
+def chat_session_history(session_id: str) -> List[Dict[str, str]]:
+    client = _remote()
+    if client is not None:
+        return client.call("session_history", {"session_id": session_id})
+
+    from bot import chat_sessions
+    return chat_sessions.get_history(session_id)
+
+def send_chat_message(
+    session_id: str,
+    prompt: str,
+    *,
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
+    client = _remote()
+    if client is not None:
+        return client.call(
+            "session_message",
+            {"session_id": session_id, "prompt": prompt},
+            cancel_event=cancel_event,
+            deadline=deadline,
+        )
+
+    from bot import chat_sessions
+    return chat_sessions.send_message(session_id, prompt, cancel_event=cancel_event, deadline=deadline)
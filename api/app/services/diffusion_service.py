@@ -1,5 +1,19 @@
 # api/app/services/diffusion_service.py
-from diffusion.pipeline import generate_image
+import threading
+from typing import Optional
 
-def generate_image_from_prompt(prompt: str) -> str:
-    return generate_image(prompt)
\ No newline at end of file
+from api.app.core.ipc import get_client
+from api.app.core.settings import settings
+
+def generate_image_from_prompt(
+    prompt: str,
+    *,
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+) -> str:
+    if settings.diffusion_server:
+        client = get_client(settings.diffusion_server, settings.model_server_authkey)
+        return client.call("image", {"prompt": prompt}, cancel_event=cancel_event, deadline=deadline)
+
+    from diffusion.pipeline import generate_image
+    return generate_image(prompt, cancel_event=cancel_event, deadline=deadline)
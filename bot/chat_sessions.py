@@ -0,0 +1,242 @@
+# bot/chat_sessions.py
+from __future__ import annotations
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import torch
+from transformers import DynamicCache, StoppingCriteriaList
+
+from bot.infer_lora import (
+    DEFAULT_BASE_MODEL,
+    DEFAULT_ADAPTER_DIR,
+    DEFAULT_MAX_NEW_TOKENS,
+    DEFAULT_TEMPERATURE,
+    DEFAULT_TOP_P,
+    SYSTEM_PROMPT,
+    _CancelCriteria,
+    _load_once,
+    _pick_device,
+)
+
+
+# ---------- Defaults ----------
+# Global budget for retained KV caches across all sessions (LRU-evicted past this).
+DEFAULT_SESSION_CACHE_MB = int(os.environ.get("SYM_SESSION_CACHE_MB", "2048"))
+# Sessions idle longer than this are dropped entirely (history + cache).
+DEFAULT_SESSION_IDLE_S = float(os.environ.get("SYM_SESSION_IDLE_S", "1800"))
+# Prompt + reply token budget; oldest turns are dropped to stay under it.
+DEFAULT_MAX_CONTEXT = int(os.environ.get("SYM_MAX_CONTEXT", "4096"))
+
+
+class ChatSession:
+    """
+    One conversation: its message history plus the KV cache for the tokens
+    already prefilled, so the next turn only prefills what is new.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.messages: List[Dict[str, str]] = [{"role": "system", "content": SYSTEM_PROMPT}]
+        self.cache: Optional[DynamicCache] = None
+        self.cache_ids: List[int] = []  # token ids whose keys/values are in cache
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def cache_bytes(self) -> int:
+        if self.cache is None:
+            return 0
+        return sum(t.nelement() * t.element_size() for t in self.cache.key_cache + self.cache.value_cache)
+
+    def drop_cache(self) -> None:
+        self.cache = None
+        self.cache_ids = []
+
+
+class SessionStore:
+    """
+    Session registry ordered by last use. KV caches are evicted oldest-first
+    once their total size passes the budget; history is kept until idle expiry.
+    """
+
+    def __init__(self, budget_bytes: int, idle_s: float):
+        self.budget_bytes = int(budget_bytes)
+        self.idle_s = float(idle_s)
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> ChatSession:
+        with self._lock:
+            self._expire()
+            session = ChatSession(uuid.uuid4().hex)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id: str) -> ChatSession:
+        with self._lock:
+            self._expire()
+            session = self._sessions[session_id]  # KeyError -> unknown session
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id)
+
+    def enforce_budget(self) -> None:
+        with self._lock:
+            total = sum(s.cache_bytes() for s in self._sessions.values())
+            for session in self._sessions.values():  # least recently used first
+                if total <= self.budget_bytes:
+                    break
+                if session.lock.locked():  # mid-generation
+                    continue
+                total -= session.cache_bytes()
+                session.drop_cache()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for sid in [sid for sid, s in self._sessions.items() if now - s.last_used > self.idle_s]:
+            if not self._sessions[sid].lock.locked():
+                del self._sessions[sid]
+
+
+STORE = SessionStore(DEFAULT_SESSION_CACHE_MB * 1024 * 1024, DEFAULT_SESSION_IDLE_S)
+
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _fit_context(
+    tok,
+    messages: List[Dict[str, str]],
+    max_context: int,
+    max_new_tokens: int,
+) -> Tuple[List[Dict[str, str]], List[int]]:
+    """
+    Render messages with the chat template, dropping the oldest user/assistant
+    turns (never the system prompt or the new user message) until
+    prompt + max_new_tokens fits in max_context.
+    """
+    msgs = list(messages)
+    while True:
+        text = tok.apply_chat_template(msgs, tokenize=False, add_generation_prompt=True)
+        ids = tok(text)["input_ids"]
+        if len(ids) + max_new_tokens <= max_context:
+            return msgs, ids
+        if len(msgs) <= 2:
+            raise ValueError(
+                f"prompt is {len(ids)} tokens; does not fit max_context={max_context} "
+                f"with max_new_tokens={max_new_tokens}"
+            )
+        # Oldest user/assistant pair (msgs[-1] is always the new user turn).
+        del msgs[1:min(3, len(msgs) - 1)]
+
+
+def create_session() -> str:
+    return STORE.create().id
+
+
+def close_session(session_id: str) -> None:
+    STORE.delete(session_id)
+
+
+def get_history(session_id: str) -> List[Dict[str, str]]:
+    return list(STORE.get(session_id).messages[1:])
+
+
+def send_message(
+    session_id: str,
+    prompt: str,
+    *,
+    base_model: str = DEFAULT_BASE_MODEL,
+    adapter_dir: str = DEFAULT_ADAPTER_DIR,
+    device: Optional[str] = None,
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+    temperature: float = DEFAULT_TEMPERATURE,
+    top_p: float = DEFAULT_TOP_P,
+    max_context: int = DEFAULT_MAX_CONTEXT,
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, object]:
+    """
+    Append a user turn to the session and generate the assistant reply.
+
+    Only tokens past the longest prefix already in the session's KV cache are
+    prefilled. Returns {"response", "prefilled_tokens", "cached_tokens", "truncated"}.
+    A cancelled turn is not committed to history.
+    """
+    prompt = (prompt or "").strip()
+    if not prompt:
+        raise ValueError("prompt is empty")
+
+    session = STORE.get(session_id)
+    chosen_device = _pick_device(device)
+    model, tok = _load_once(base_model, adapter_dir, chosen_device)
+
+    with session.lock:
+        msgs = session.messages + [{"role": "user", "content": prompt}]
+        msgs, ids = _fit_context(tok, msgs, max_context, max_new_tokens)
+        truncated = len(msgs) < len(session.messages) + 1
+
+        # Reuse the cached prefix; at least one token must be fed to generate().
+        reuse = min(_common_prefix(session.cache_ids, ids), len(ids) - 1)
+        if session.cache is None or reuse == 0:
+            session.cache = DynamicCache()
+            reuse = 0
+        else:
+            session.cache.crop(reuse)
+
+        input_ids = torch.tensor([ids], dtype=torch.long)
+        if chosen_device == "cuda":
+            input_ids = input_ids.to("cuda")
+
+        stopping = None
+        if cancel_event is not None or deadline is not None:
+            stopping = StoppingCriteriaList([_CancelCriteria(cancel_event, deadline)])
+
+        with torch.no_grad():
+            out = model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=session.cache,
+                use_cache=True,
+                stopping_criteria=stopping,
+                max_new_tokens=max_new_tokens,
+                do_sample=(temperature > 0),
+                temperature=temperature,
+                top_p=top_p,
+                eos_token_id=tok.eos_token_id,
+                pad_token_id=tok.eos_token_id,
+            )
+
+        # The last generated token never went through a forward pass, so the
+        # cache covers one token less than `out`.
+        session.cache_ids = out[0].tolist()[: session.cache.get_seq_length()]
+
+        reply = tok.decode(out[0][len(ids):], skip_special_tokens=True).strip()
+
+        stopped = (cancel_event is not None and cancel_event.is_set()) or (
+            deadline is not None and time.monotonic() >= deadline
+        )
+        if not stopped:
+            session.messages = msgs + [{"role": "assistant", "content": reply}]
+
+    STORE.enforce_budget()
+
+    return {
+        "response": reply,
+        "prefilled_tokens": len(ids) - reuse,
+        "cached_tokens": reuse,
+        "truncated": truncated,
+    }
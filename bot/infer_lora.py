@@ -2,12 +2,16 @@
 from __future__ import annotations
 
 import os
+import json
+import time
 import argparse
+import threading
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import AutoTokenizer, AutoModelForCausalLM, StoppingCriteria, StoppingCriteriaList
 from peft import PeftModel
 
 
@@ -20,17 +24,36 @@ DEFAULT_ADAPTER_DIR = os.environ.get(
     str(REPO_ROOT / "bot" / "adapters" / "my_qwen_lora_baseline_20251228-004"),
 )
 
+# Inference-ready safetensors snapshot written by bot/snapshot.py.
+# When set, it replaces base model + adapter loading (mmap, low CPU memory).
+DEFAULT_SNAPSHOT_DIR = os.environ.get("SYM_SNAPSHOT_DIR", "").strip()
+SNAPSHOT_META = "symoneural_snapshot.json"
+
 # Generation defaults (safe + sane)
 DEFAULT_MAX_NEW_TOKENS = int(os.environ.get("SYM_MAX_NEW_TOKENS", "256"))
 DEFAULT_TEMPERATURE = float(os.environ.get("SYM_TEMPERATURE", "0.7"))
 DEFAULT_TOP_P = float(os.environ.get("SYM_TOP_P", "0.9"))
 
+SYSTEM_PROMPT = "You are SyMoNeuRaL Bot. Be helpful, concise, and accurate."
+
+# Speculative (assisted) decoding: a small same-tokenizer draft model proposes
+# tokens, the adapted base model verifies them. Empty SYM_DRAFT_MODEL = disabled.
+DEFAULT_DRAFT_MODEL = os.environ.get("SYM_DRAFT_MODEL", "").strip()
+DEFAULT_DRAFT_ADAPTER_DIR = os.environ.get("SYM_DRAFT_ADAPTER_DIR", "").strip()
+DEFAULT_DRAFT_TOKENS = int(os.environ.get("SYM_DRAFT_TOKENS", "5"))
+
 
 # ---------- Internal loader cache ----------
 _MODEL = None
 _TOKENIZER = None
 _DEVICE = None
 
+_DRAFT = None
+_DRAFT_KEY = None
+# Draft length is a load-time setting: transformers reads it from the draft
+# model's generation_config only (generate() kwargs do not reach it).
+_DRAFT_TOKENS = DEFAULT_DRAFT_TOKENS
+
 
 def _pick_device(prefer: Optional[str] = None) -> str:
     """
@@ -43,41 +66,190 @@ def _pick_device(prefer: Optional[str] = None) -> str:
     return "cuda" if torch.cuda.is_available() else "cpu"
 
 
+class _CancelCriteria(StoppingCriteria):
+    """
+    Stops generation when the caller sets cancel_event (e.g. client disconnected)
+    or when the monotonic deadline has passed. Checked once per decoded token.
+    """
+
+    def __init__(self, cancel_event: Optional[threading.Event], deadline: Optional[float]):
+        self.cancel_event = cancel_event
+        self.deadline = deadline
+
+    def __call__(self, input_ids, scores, **kwargs):
+        stop = (self.cancel_event is not None and self.cancel_event.is_set()) or (
+            self.deadline is not None and time.monotonic() >= self.deadline
+        )
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+
+class _RowCancelCriteria(StoppingCriteria):
+    """Per-row _CancelCriteria for batched generate(): each row stops on its own event/deadline."""
+
+    def __init__(self, cancel_events: List[Optional[threading.Event]], deadlines: List[Optional[float]]):
+        self.cancel_events = cancel_events
+        self.deadlines = deadlines
+
+    def __call__(self, input_ids, scores, **kwargs):
+        now = time.monotonic()
+        stop = [
+            (e is not None and e.is_set()) or (d is not None and now >= d)
+            for e, d in zip(self.cancel_events, self.deadlines)
+        ]
+        return torch.tensor(stop, dtype=torch.bool, device=input_ids.device)
+
+
 def _load_once(
     base_model: str,
     adapter_dir: str,
     device: str,
+    snapshot_dir: Optional[str] = None,
 ):
+    """
+    snapshot_dir=None: SYM_SNAPSHOT_DIR applies only while base_model /
+    adapter_dir are the defaults; explicitly chosen ones win (with a warning).
+    """
     global _MODEL, _TOKENIZER, _DEVICE
 
     if _MODEL is not None and _TOKENIZER is not None and _DEVICE == device:
         return _MODEL, _TOKENIZER
 
+    t0 = time.perf_counter()
     print(f"[+] Device: {device}")
-    print(f"[+] Adapter dir: {adapter_dir}")
-    print(f"[+] Base model: {base_model}")
 
-    _TOKENIZER = AutoTokenizer.from_pretrained(base_model, use_fast=True)
+    if snapshot_dir is None and DEFAULT_SNAPSHOT_DIR:
+        if (base_model, adapter_dir) == (DEFAULT_BASE_MODEL, DEFAULT_ADAPTER_DIR):
+            snapshot_dir = DEFAULT_SNAPSHOT_DIR
+        else:
+            print(f"[!] Ignoring SYM_SNAPSHOT_DIR={DEFAULT_SNAPSHOT_DIR}: base model / adapter dir given explicitly")
+
+    if snapshot_dir:
+        _TOKENIZER, _MODEL = _load_snapshot(snapshot_dir, device)
+    else:
+        print(f"[+] Adapter dir: {adapter_dir}")
+        print(f"[+] Base model: {base_model}")
+
+        _TOKENIZER = AutoTokenizer.from_pretrained(base_model, use_fast=True)
+
+        # Load base
+        base = AutoModelForCausalLM.from_pretrained(
+            base_model,
+            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+            device_map="auto" if device == "cuda" else None,
+        )
 
-    # Load base
-    base = AutoModelForCausalLM.from_pretrained(
-        base_model,
-        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-        device_map="auto" if device == "cuda" else None,
-    )
+        # Apply LoRA adapter
+        _MODEL = PeftModel.from_pretrained(base, adapter_dir)
+
+    # Left padding so batched prompts all end where generation starts.
+    _TOKENIZER.padding_side = "left"
+    if _TOKENIZER.pad_token_id is None:
+        _TOKENIZER.pad_token = _TOKENIZER.eos_token
 
-    # Apply LoRA adapter
-    _MODEL = PeftModel.from_pretrained(base, adapter_dir)
     _MODEL.eval()
 
     if device == "cpu":
         _MODEL.to("cpu")
 
     _DEVICE = device
+    print(f"[+] Model loaded in {time.perf_counter() - t0:.2f}s")
     return _MODEL, _TOKENIZER
 
 
-def run_inference(
+def _load_snapshot(snapshot_dir: str, device: str):
+    """
+    Load a bot/snapshot.py directory. Exported for this device, the weights are
+    already in its dtype, so safetensors are mmapped with low_cpu_mem_usage (no
+    fp32 materialize + copy); processes on one host share the page cache. An
+    unmerged snapshot carries its adapter under adapter/.
+    """
+    snap = Path(snapshot_dir)
+    meta = json.loads((snap / SNAPSHOT_META).read_text(encoding="utf-8"))
+    print(f"[+] Snapshot: {snap} ({meta['dtype']}, merged={meta['merged']})")
+
+    # Same per-device dtype as the from_pretrained path; the snapshot never overrides it.
+    dtype = "float16" if device == "cuda" else "float32"
+    if meta["dtype"] != dtype:
+        print(
+            f"[!] Snapshot is {meta['dtype']} (exported for {meta.get('device', '?')}); converting to "
+            f"{dtype} for {device}. Re-export with --device {device} to load it without a copy."
+        )
+
+    tok = AutoTokenizer.from_pretrained(str(snap), use_fast=True)
+    model = AutoModelForCausalLM.from_pretrained(
+        str(snap),
+        torch_dtype=getattr(torch, dtype),
+        device_map="auto" if device == "cuda" else None,
+        low_cpu_mem_usage=True,
+        use_safetensors=True,
+    )
+    if not meta["merged"]:
+        model = PeftModel.from_pretrained(model, str(snap / "adapter"))
+    return tok, model
+
+
+def _load_draft_once(
+    draft_model: str,
+    draft_adapter_dir: str,
+    device: str,
+    tok,
+):
+    """
+    Load the draft model for assisted generation. A draft LoRA (if any) is merged
+    so generate() sees a plain PreTrainedModel.
+    """
+    global _DRAFT, _DRAFT_KEY
+
+    key = (draft_model, draft_adapter_dir, device, _DRAFT_TOKENS)
+    if _DRAFT is not None and _DRAFT_KEY == key:
+        return _DRAFT
+
+    print(f"[+] Draft model: {draft_model}")
+    if draft_adapter_dir:
+        print(f"[+] Draft adapter dir: {draft_adapter_dir}")
+
+    draft_tok = AutoTokenizer.from_pretrained(draft_model, use_fast=True)
+    if draft_tok.get_vocab() != tok.get_vocab():
+        raise ValueError(f"Draft model {draft_model} does not share the base model tokenizer")
+
+    draft = AutoModelForCausalLM.from_pretrained(
+        draft_model,
+        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+        device_map="auto" if device == "cuda" else None,
+    )
+    if draft_adapter_dir:
+        draft = PeftModel.from_pretrained(draft, draft_adapter_dir).merge_and_unload()
+    draft.eval()
+    # Set once at load, never per request. "heuristic_transient" adapts the draft
+    # length within one generate() and resets after it, so concurrent requests do
+    # not write into this shared config (plain "heuristic" persists its updates).
+    draft.generation_config.num_assistant_tokens = _DRAFT_TOKENS
+    draft.generation_config.num_assistant_tokens_schedule = "heuristic_transient"
+
+    if device == "cpu":
+        draft.to("cpu")
+
+    _DRAFT = draft
+    _DRAFT_KEY = key
+    return _DRAFT
+
+
+@contextmanager
+def _count_forwards(module):
+    """Counts forward() calls on a module for the duration of the block."""
+    calls = [0]
+
+    def _hook(_m, _inp, _out):
+        calls[0] += 1
+
+    handle = module.register_forward_hook(_hook)
+    try:
+        yield calls
+    finally:
+        handle.remove()
+
+
+def _run(
     prompt: str,
     *,
     base_model: str = DEFAULT_BASE_MODEL,
@@ -86,21 +258,30 @@ def run_inference(
     max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
     temperature: float = DEFAULT_TEMPERATURE,
     top_p: float = DEFAULT_TOP_P,
-) -> str:
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+    draft_model: str = DEFAULT_DRAFT_MODEL,
+    draft_adapter_dir: str = DEFAULT_DRAFT_ADAPTER_DIR,
+) -> Tuple[str, dict]:
     """
-    Stable function API for the rest of the monorepo.
-    Returns generated text.
+    run_inference() plus decode stats:
+      new_tokens, seconds, tokens_per_s, and when a draft model is used
+      target_forwards, draft_forwards, acceptance_rate.
     """
     prompt = (prompt or "").strip()
     if not prompt:
-        return ""
+        return "", {}
 
     chosen_device = _pick_device(device)
     model, tok = _load_once(base_model, adapter_dir, chosen_device)
 
+    assistant = None
+    if draft_model:
+        assistant = _load_draft_once(draft_model, draft_adapter_dir, chosen_device, tok)
+
     # Qwen Instruct-style chat template (robust)
     messages = [
-        {"role": "system", "content": "You are SyMoNeuRaL Bot. Be helpful, concise, and accurate."},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": prompt},
     ]
 
@@ -110,15 +291,47 @@ def run_inference(
     if chosen_device == "cuda":
         inputs = {k: v.to("cuda") for k, v in inputs.items()}
 
-    with torch.no_grad():
-        out = model.generate(
-            **inputs,
-            max_new_tokens=max_new_tokens,
-            do_sample=(temperature > 0),
-            temperature=temperature,
-            top_p=top_p,
-            eos_token_id=tok.eos_token_id,
-            pad_token_id=tok.eos_token_id,
+    stopping = None
+    if cancel_event is not None or deadline is not None:
+        stopping = StoppingCriteriaList([_CancelCriteria(cancel_event, deadline)])
+
+    target = model.get_base_model() if hasattr(model, "get_base_model") else model
+
+    with torch.no_grad(), _count_forwards(target) as target_calls:
+        draft_ctx = _count_forwards(assistant) if assistant is not None else nullcontext([0])
+        with draft_ctx as draft_calls:
+            t0 = time.perf_counter()
+            out = model.generate(
+                **inputs,
+                stopping_criteria=stopping,
+                assistant_model=assistant,
+                max_new_tokens=max_new_tokens,
+                do_sample=(temperature > 0),
+                temperature=temperature,
+                top_p=top_p,
+                eos_token_id=tok.eos_token_id,
+                pad_token_id=tok.eos_token_id,
+            )
+            seconds = time.perf_counter() - t0
+
+    new_tokens = int(out.shape[1] - inputs["input_ids"].shape[1])
+    stats = {
+        "new_tokens": new_tokens,
+        "seconds": seconds,
+        "tokens_per_s": new_tokens / seconds if seconds > 0 else 0.0,
+    }
+    if assistant is not None:
+        # Each verification pass yields (accepted drafts + 1) tokens, so
+        # accepted = new_tokens - target passes; each draft forward proposes one token.
+        accepted = max(0, new_tokens - target_calls[0])
+        stats.update({
+            "target_forwards": target_calls[0],
+            "draft_forwards": draft_calls[0],
+            "acceptance_rate": accepted / draft_calls[0] if draft_calls[0] else 0.0,
+        })
+        print(
+            f"[+] Speculative: {new_tokens} tok in {seconds:.2f}s "
+            f"({stats['tokens_per_s']:.2f} tok/s), acceptance {stats['acceptance_rate']:.0%}"
         )
 
     decoded = tok.decode(out[0], skip_special_tokens=True)
@@ -128,12 +341,121 @@ def run_inference(
     # Many chat templates include the user prompt; we trim by the last user prompt occurrence.
     idx = decoded.rfind(prompt)
     if idx != -1:
-        return decoded[idx + len(prompt):].strip()
+        return decoded[idx + len(prompt):].strip(), stats
+
+    return decoded.strip(), stats
+
+
+def run_inference(
+    prompt: str,
+    *,
+    base_model: str = DEFAULT_BASE_MODEL,
+    adapter_dir: str = DEFAULT_ADAPTER_DIR,
+    device: Optional[str] = None,
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+    temperature: float = DEFAULT_TEMPERATURE,
+    top_p: float = DEFAULT_TOP_P,
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
+    draft_model: str = DEFAULT_DRAFT_MODEL,
+    draft_adapter_dir: str = DEFAULT_DRAFT_ADAPTER_DIR,
+) -> str:
+    """
+    Stable function API for the rest of the monorepo.
+    Returns generated text.
+
+    cancel_event / deadline (time.monotonic()) stop decoding early;
+    whatever was generated so far is returned.
+
+    draft_model enables speculative decoding; with temperature=0 the output
+    matches plain greedy decoding.
+    """
+    text, _ = _run(
+        prompt,
+        base_model=base_model,
+        adapter_dir=adapter_dir,
+        device=device,
+        max_new_tokens=max_new_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        cancel_event=cancel_event,
+        deadline=deadline,
+        draft_model=draft_model,
+        draft_adapter_dir=draft_adapter_dir,
+    )
+    return text
+
+
+def run_inference_batch(
+    prompts: List[str],
+    *,
+    base_model: str = DEFAULT_BASE_MODEL,
+    adapter_dir: str = DEFAULT_ADAPTER_DIR,
+    device: Optional[str] = None,
+    max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+    temperature: float = DEFAULT_TEMPERATURE,
+    top_p: float = DEFAULT_TOP_P,
+    cancel_events: Optional[List[Optional[threading.Event]]] = None,
+    deadlines: Optional[List[Optional[float]]] = None,
+) -> List[str]:
+    """
+    Batched run_inference(): one generate() call over left-padded prompts.
+    cancel_events / deadlines are per prompt and only stop their own row.
+    Returns one reply per prompt ("" for empty prompts).
+    """
+    n = len(prompts)
+    cancel_events = list(cancel_events) if cancel_events is not None else [None] * n
+    deadlines = list(deadlines) if deadlines is not None else [None] * n
+
+    rows = [i for i, p in enumerate(prompts) if (p or "").strip()]
+    results = [""] * n
+    if not rows:
+        return results
+
+    chosen_device = _pick_device(device)
+    model, tok = _load_once(base_model, adapter_dir, chosen_device)
+
+    texts = [
+        tok.apply_chat_template(
+            [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompts[i].strip()},
+            ],
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        for i in rows
+    ]
+    inputs = tok(texts, return_tensors="pt", padding=True)
 
-    return decoded.strip()
+    if chosen_device == "cuda":
+        inputs = {k: v.to("cuda") for k, v in inputs.items()}
+
+    stopping = StoppingCriteriaList([
+        _RowCancelCriteria([cancel_events[i] for i in rows], [deadlines[i] for i in rows])
+    ])
+
+    with torch.no_grad():
+        out = model.generate(
+            **inputs,
+            stopping_criteria=stopping,
+            max_new_tokens=max_new_tokens,
+            do_sample=(temperature > 0),
+            temperature=temperature,
+            top_p=top_p,
+            eos_token_id=tok.eos_token_id,
+            pad_token_id=tok.pad_token_id,
+        )
+
+    prompt_len = inputs["input_ids"].shape[1]
+    for row, i in enumerate(rows):
+        results[i] = tok.decode(out[row][prompt_len:], skip_special_tokens=True).strip()
+    return results
 
 
 def main():
+    global _DRAFT_TOKENS
+
     ap = argparse.ArgumentParser()
     ap.add_argument("--prompt", required=True)
     ap.add_argument("--base-model", default=DEFAULT_BASE_MODEL)
@@ -142,23 +464,68 @@ def main():
     ap.add_argument("--max-new-tokens", type=int, default=DEFAULT_MAX_NEW_TOKENS)
     ap.add_argument("--temperature", type=float, default=DEFAULT_TEMPERATURE)
     ap.add_argument("--top-p", type=float, default=DEFAULT_TOP_P)
+    ap.add_argument("--draft-model", default=DEFAULT_DRAFT_MODEL, help="e.g. Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--draft-adapter-dir", default=DEFAULT_DRAFT_ADAPTER_DIR)
+    ap.add_argument(
+        "--draft-tokens",
+        type=int,
+        default=DEFAULT_DRAFT_TOKENS,
+        help="initial draft length (load-time; same as SYM_DRAFT_TOKENS)",
+    )
+    ap.add_argument(
+        "--compare-plain",
+        action="store_true",
+        help="also run without the draft model; report speedup and whether outputs match",
+    )
     args = ap.parse_args()
+    _DRAFT_TOKENS = args.draft_tokens  # before the draft model loads
+
+    kwargs = dict(
+        base_model=args.base_model,
+        adapter_dir=args.adapter_dir,
+        device=args.device if args.device != "auto" else None,
+        max_new_tokens=args.max_new_tokens,
+        temperature=args.temperature,
+        top_p=args.top_p,
+    )
 
     print("\n--- PROMPT ---")
     print(args.prompt)
-    print("\n--- OUTPUT ---")
-    print(
-        run_inference(
+
+    compare = bool(args.draft_model and args.compare_plain)
+    if compare:
+        # Warm both paths (model load, first-generate() allocations) so neither
+        # timed run pays that cost, then time plain first.
+        warm = dict(kwargs, max_new_tokens=8)
+        _run(args.prompt, draft_model="", **warm)
+        _run(
             args.prompt,
-            base_model=args.base_model,
-            adapter_dir=args.adapter_dir,
-            device=args.device if args.device != "auto" else None,
-            max_new_tokens=args.max_new_tokens,
-            temperature=args.temperature,
-            top_p=args.top_p,
+            draft_model=args.draft_model,
+            draft_adapter_dir=args.draft_adapter_dir,
+            **warm,
         )
+        plain_text, plain_stats = _run(args.prompt, draft_model="", **kwargs)
+
+    text, stats = _run(
+        args.prompt,
+        draft_model=args.draft_model,
+        draft_adapter_dir=args.draft_adapter_dir,
+        **kwargs,
     )
 
+    print("\n--- OUTPUT ---")
+    print(text)
+
+    if compare:
+        print("\n--- SPECULATIVE vs PLAIN ---")
+        print(f"[+] Plain:       {plain_stats['tokens_per_s']:.2f} tok/s ({plain_stats['seconds']:.2f}s)")
+        print(f"[+] Speculative: {stats['tokens_per_s']:.2f} tok/s ({stats['seconds']:.2f}s)")
+        print(f"[+] Acceptance:  {stats['acceptance_rate']:.0%}")
+        if stats["seconds"] > 0:
+            print(f"[+] Speedup:     {plain_stats['seconds'] / stats['seconds']:.2f}x")
+        if args.temperature <= 0:
+            print(f"[{'✓' if text == plain_text else '!'}] Output identical to greedy: {text == plain_text}")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
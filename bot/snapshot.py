@@ -0,0 +1,184 @@
+# bot/snapshot.py
+"""
+Write an inference-ready snapshot of base model + LoRA adapter:
+weights in the dtype the runtime uses on the target device (float16 on
+cuda, float32 on cpu), safetensors shards, tokenizer, and
+symoneural_snapshot.json. Point SYM_SNAPSHOT_DIR at it to use it.
+
+  python -m bot.snapshot --out snapshots/qwen3b_lora_004 --device cuda  (adapter merged)
+  python -m bot.snapshot --out snapshots/qwen3b_lora_004 --no-merge     (adapter kept in adapter/)
+  python -m bot.snapshot --time-load snapshots/qwen3b_lora_004
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from peft import PeftModel
+
+from bot.infer_lora import (
+    REPO_ROOT,
+    DEFAULT_BASE_MODEL,
+    DEFAULT_ADAPTER_DIR,
+    SNAPSHOT_META,
+    _load_once,
+)
+
+
+def write_snapshot(
+    out_dir: str,
+    *,
+    base_model: str = DEFAULT_BASE_MODEL,
+    adapter_dir: str = DEFAULT_ADAPTER_DIR,
+    device: str = "cpu",
+    dtype: Optional[str] = None,
+    merge: bool = True,
+    max_shard_size: str = "2GB",
+) -> None:
+    """
+    Export the snapshot for `device`. dtype defaults to what the runtime loads
+    on that device; anything else is converted (and warned about) at load.
+    """
+    dtype = dtype or _runtime_dtype(device)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+
+    tok = AutoTokenizer.from_pretrained(base_model, use_fast=True)
+    base = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=getattr(torch, dtype))
+
+    if merge:
+        model = PeftModel.from_pretrained(base, adapter_dir).merge_and_unload()
+        model.save_pretrained(str(out), safe_serialization=True, max_shard_size=max_shard_size)
+        del model
+    else:
+        # Save the base before PeftModel injects LoRA layers into it (that would
+        # rename q_proj.weight -> q_proj.base_layer.weight), then copy the adapter.
+        base.save_pretrained(str(out), safe_serialization=True, max_shard_size=max_shard_size)
+        adapter_out = out / "adapter"
+        if adapter_out.exists():
+            shutil.rmtree(adapter_out)
+        shutil.copytree(adapter_dir, adapter_out)
+
+    del base  # free before the load-back check
+    tok.save_pretrained(str(out))
+
+    meta = {
+        "base_model": base_model,
+        "adapter_dir": str(adapter_dir),
+        "dtype": dtype,
+        "device": device,
+        "merged": merge,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    (out / SNAPSHOT_META).write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    verify_snapshot(str(out))
+
+
+def verify_snapshot(snapshot_dir: str) -> None:
+    """
+    Load the saved weights back and fail on any missing / unexpected / mismatched
+    key, so a bad snapshot never silently runs with randomly initialised layers.
+    """
+    meta = json.loads((Path(snapshot_dir) / SNAPSHOT_META).read_text(encoding="utf-8"))
+    model, info = AutoModelForCausalLM.from_pretrained(
+        snapshot_dir,
+        torch_dtype=getattr(torch, meta["dtype"]),
+        low_cpu_mem_usage=True,
+        use_safetensors=True,
+        output_loading_info=True,
+    )
+    del model
+
+    problems = {k: info.get(k) for k in ("missing_keys", "unexpected_keys", "mismatched_keys") if info.get(k)}
+    if problems:
+        detail = "; ".join(f"{k}: {list(v)[:5]}{'…' if len(v) > 5 else ''}" for k, v in problems.items())
+        raise RuntimeError(f"Snapshot {snapshot_dir} does not load cleanly ({detail})")
+    print("[✓] Snapshot load-back check passed")
+
+
+def _runtime_dtype(device: str) -> str:
+    """What bot/infer_lora.py loads on this device."""
+    return "float16" if device == "cuda" else "float32"
+
+
+def _time_load_subprocess(*cli_args: str) -> float:
+    """Fresh interpreter, so nothing is cached in-process."""
+    res = subprocess.run(
+        [sys.executable, "-m", "bot.snapshot", *cli_args],
+        cwd=str(REPO_ROOT),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=str(REPO_ROOT / "snapshots" / "qwen_lora"))
+    ap.add_argument("--base-model", default=DEFAULT_BASE_MODEL)
+    ap.add_argument("--adapter-dir", default=DEFAULT_ADAPTER_DIR)
+    ap.add_argument("--device", default="cpu", choices=["cpu", "cuda"], help="device the snapshot is for")
+    ap.add_argument(
+        "--dtype",
+        default=None,
+        choices=["float32", "float16", "bfloat16"],
+        help="default: the runtime dtype for --device (cuda float16, cpu float32)",
+    )
+    ap.add_argument("--no-merge", action="store_true", help="keep the adapter separate (adapter/)")
+    ap.add_argument("--time-load", default=None, metavar="SNAPSHOT_DIR", help="load a snapshot, print seconds")
+    ap.add_argument("--time-source", action="store_true", help="load base model + adapter, print seconds")
+    args = ap.parse_args()
+
+    if args.time_load or args.time_source:
+        t0 = time.perf_counter()
+        if args.time_load:
+            _load_once("", "", args.device, snapshot_dir=args.time_load)  # explicit snapshot_dir
+        else:
+            _load_once(args.base_model, args.adapter_dir, args.device, snapshot_dir="")  # never a snapshot
+        print(f"{time.perf_counter() - t0:.3f}")
+        return
+
+    dtype = args.dtype or _runtime_dtype(args.device)
+    print(f"[+] Base model: {args.base_model}")
+    print(f"[+] Adapter dir: {args.adapter_dir}")
+    print(f"[+] Out: {args.out} ({dtype} for {args.device}, merged={not args.no_merge})")
+    if dtype != _runtime_dtype(args.device):
+        print(f"[!] {args.device} runs in {_runtime_dtype(args.device)}; this snapshot will be converted at load")
+
+    # Both measured the way the runtime loads on --device, in fresh interpreters.
+    local = lambda p: os.path.abspath(p) if os.path.exists(p) else p  # subprocess runs from REPO_ROOT
+    before = _time_load_subprocess(
+        "--time-source",
+        "--base-model", local(args.base_model),
+        "--adapter-dir", local(args.adapter_dir),
+        "--device", args.device,
+    )
+    write_snapshot(
+        args.out,
+        base_model=args.base_model,
+        adapter_dir=args.adapter_dir,
+        device=args.device,
+        dtype=dtype,
+        merge=not args.no_merge,
+    )
+    after = _time_load_subprocess("--time-load", os.path.abspath(args.out), "--device", args.device)
+
+    print(f"[+] Cold start before (from_pretrained + adapter): {before:.2f}s")
+    print(f"[+] Cold start after  (mmap snapshot):            {after:.2f}s")
+    print(f"[✓] Snapshot written. Use: SYM_SNAPSHOT_DIR={os.path.abspath(args.out)}")
+
+
+if __name__ == "__main__":
+    main()
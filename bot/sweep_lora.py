@@ -0,0 +1,319 @@
+# bot/sweep_lora.py
+"""
+LoRA hyperparameter sweep: grid or random search over train_lora.py settings.
+
+  python -m bot.sweep_lora --spec sweep.json --workers 2
+
+The dataset is loaded and tokenized once and saved as Arrow files that every
+trial process memory-maps (datasets.load_from_disk). Trials run in a process
+pool, each pinned to its own slice of CPU cores. Trials whose loss is worse
+than the median of the others at the same step are stopped early.
+
+Spec (JSON):
+  {
+    "search": "grid" | "random",
+    "num_trials": 8,                      # random only
+    "seed": 0,
+    "params": {
+      "r": [4, 8, 16],
+      "lora_alpha": [16, 32],
+      "lora_dropout": [0.05],
+      "target_modules": [["q_proj", "v_proj"], ["q_proj", "k_proj", "v_proj", "o_proj"]],
+      "learning_rate": {"min": 5e-5, "max": 3e-4, "log": true},
+      "num_train_epochs": [1]
+    }
+  }
+
+Lists are choices; {"min", "max", "log"} ranges are sampled (random search only).
+Output: <sweep-dir>/leaderboard.json and leaderboard.md, one adapter dir per trial.
+"""
+from __future__ import annotations
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from statistics import median
+from typing import Any, Dict, List
+
+import torch
+from datasets import load_from_disk
+from transformers import DataCollatorWithPadding, Trainer, TrainerCallback
+from peft import get_peft_model
+
+from bot.train_lora import (
+    DATA_FILES,
+    LORA_ALPHA,
+    LORA_DROPOUT,
+    LORA_R,
+    LORA_TARGETS,
+    LR,
+    EPOCHS,
+    MODEL_NAME,
+    _load_multi_dataset,
+    build_lora_config,
+    build_training_args,
+    load_base_model,
+    load_tokenizer,
+    tokenize_dataset,
+)
+
+BASELINE = {
+    "r": LORA_R,
+    "lora_alpha": LORA_ALPHA,
+    "lora_dropout": LORA_DROPOUT,
+    "target_modules": LORA_TARGETS,
+    "learning_rate": LR,
+    "num_train_epochs": EPOCHS,
+}
+
+
+# ---------- Search space ----------
+
+def _sample(space: Any, rng: random.Random) -> Any:
+    if isinstance(space, list):
+        return rng.choice(space)
+    if isinstance(space, dict):
+        lo, hi = float(space["min"]), float(space["max"])
+        if space.get("log"):
+            return math.exp(rng.uniform(math.log(lo), math.log(hi)))
+        return rng.uniform(lo, hi)
+    return space
+
+
+def build_trials(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    params = spec.get("params", {})
+    search = spec.get("search", "grid")
+
+    if search == "grid":
+        for k, v in params.items():
+            if not isinstance(v, list):
+                raise ValueError(f"grid search needs a list of values for {k!r}")
+        keys = list(params)
+        combos = [dict(zip(keys, vals)) for vals in itertools.product(*(params[k] for k in keys))]
+    elif search == "random":
+        rng = random.Random(spec.get("seed", 0))
+        combos = [{k: _sample(v, rng) for k, v in params.items()} for _ in range(int(spec.get("num_trials", 8)))]
+    else:
+        raise ValueError(f"unknown search: {search!r} (grid|random)")
+
+    return [{"trial_id": i, "params": {**BASELINE, **c}} for i, c in enumerate(combos)]
+
+
+# ---------- Worker process ----------
+
+def _init_worker(core_slots) -> None:
+    """Pin this pool process to one slice of cores; cap torch threads to match."""
+    cpus = core_slots.get()
+    try:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        else:
+            # Windows / macOS: no sched_setaffinity, psutil covers Windows.
+            import psutil
+
+            psutil.Process().cpu_affinity(cpus)
+    except (ImportError, AttributeError, OSError) as e:
+        print(f"[!] CPU pinning unavailable ({type(e).__name__}: {e}); threads capped only")
+    torch.set_num_threads(len(cpus))
+
+
+class _SweepCallback(TrainerCallback):
+    """
+    Publishes each logged loss to the shared report table and stops the trial
+    if it is worse than the median of other trials at the same step.
+    """
+
+    def __init__(self, trial_id: int, reports, dataset_tokens: int, prune: Dict[str, Any]):
+        self.trial_id = trial_id
+        self.reports = reports
+        self.dataset_tokens = dataset_tokens
+        self.prune = prune
+        self.pruned = False
+        self.t0 = time.perf_counter()
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.t0 = time.perf_counter()  # train loop only, like train_runtime
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        if not logs or "loss" not in logs:
+            return
+        step = state.global_step
+        loss = float(logs["loss"])
+        self.reports[f"{step}:{self.trial_id}"] = loss
+
+        elapsed = time.perf_counter() - self.t0
+        tok_s = self.dataset_tokens * (state.epoch or 0.0) / elapsed if elapsed > 0 else 0.0
+        print(f"[trial {self.trial_id}] step {step} loss {loss:.4f} ({tok_s:.0f} tok/s)")
+
+        if not self.prune.get("enabled", True) or step < int(self.prune.get("warmup_steps", 20)):
+            return
+        others = [v for k, v in self.reports.items() if k.startswith(f"{step}:") and k != f"{step}:{self.trial_id}"]
+        if len(others) >= int(self.prune.get("min_trials", 2)) and loss > median(others):
+            print(f"[trial {self.trial_id}] pruned at step {step} (loss {loss:.4f} > median {median(others):.4f})")
+            self.pruned = True
+            control.should_training_stop = True
+
+
+def _run_trial(trial: Dict[str, Any], data_dir: str, sweep_dir: str, reports, prune: Dict[str, Any]) -> Dict[str, Any]:
+    p = trial["params"]
+    out_dir = str(Path(sweep_dir) / f"trial_{trial['trial_id']:03d}")
+    result = {"trial_id": trial["trial_id"], "params": p, "adapter_dir": out_dir}
+
+    t0 = time.perf_counter()
+    try:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        ds = load_from_disk(data_dir)  # Arrow files are mmapped, shared across trials
+        tokenizer = load_tokenizer()
+        dataset_tokens = sum(len(x) for x in ds["input_ids"])
+
+        model = load_base_model(device)
+        model = get_peft_model(
+            model,
+            build_lora_config(
+                r=int(p["r"]),
+                lora_alpha=int(p["lora_alpha"]),
+                lora_dropout=float(p["lora_dropout"]),
+                target_modules=p["target_modules"],
+            ),
+        )
+
+        cb = _SweepCallback(trial["trial_id"], reports, dataset_tokens, prune)
+        trainer = Trainer(
+            model=model,
+            args=build_training_args(
+                out_dir,
+                device,
+                learning_rate=float(p["learning_rate"]),
+                num_train_epochs=float(p["num_train_epochs"]),
+                save_strategy="no",
+                logging_steps=int(prune.get("logging_steps", 10)),
+            ),
+            train_dataset=ds,
+            data_collator=DataCollatorWithPadding(tokenizer=tokenizer, padding=True, return_tensors="pt"),
+            callbacks=[cb],
+        )
+        train_out = trainer.train()
+        trainer.save_model(out_dir)
+        tokenizer.save_pretrained(out_dir)
+
+        losses = [h["loss"] for h in trainer.state.log_history if "loss" in h]
+        train_s = float(train_out.metrics.get("train_runtime", 0.0))
+        result.update({
+            "status": "pruned" if cb.pruned else "complete",
+            "final_loss": losses[-1] if losses else None,
+            "best_loss": min(losses) if losses else None,
+            "steps": trainer.state.global_step,
+            "wall_s": time.perf_counter() - t0,  # incl. data / model load and adapter save
+            "train_s": train_s,
+            "tokens_per_s": dataset_tokens * (trainer.state.epoch or 0.0) / train_s if train_s > 0 else 0.0,
+        })
+    except Exception as e:
+        result.update({"status": "failed", "error": f"{type(e).__name__}: {e}", "wall_s": time.perf_counter() - t0})
+    return result
+
+
+# ---------- Driver ----------
+
+def _prepare_data(data_files: str, sweep_dir: Path) -> str:
+    data_dir = sweep_dir / "tokenized"
+    ds = _load_multi_dataset(data_files)
+    ds = tokenize_dataset(ds, load_tokenizer())
+    ds.save_to_disk(str(data_dir))
+    return str(data_dir)
+
+
+def _write_leaderboard(results: List[Dict[str, Any]], sweep_dir: Path) -> None:
+    rank = {"complete": 0, "pruned": 1, "failed": 2}
+    results = sorted(
+        results,
+        key=lambda r: (rank[r["status"]], r.get("final_loss") if r.get("final_loss") is not None else float("inf")),
+    )
+    (sweep_dir / "leaderboard.json").write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    lines = [
+        "| # | status | final loss | best loss | steps | wall s | train s | train tok/s | r | alpha | dropout | lr | epochs | targets | adapter |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    for i, r in enumerate(results, 1):
+        p = r["params"]
+        fmt = lambda v, f: (f.format(v) if v is not None else "-")
+        lines.append(
+            f"| {i} | {r['status']} | {fmt(r.get('final_loss'), '{:.4f}')} | {fmt(r.get('best_loss'), '{:.4f}')} "
+            f"| {r.get('steps', '-')} | {fmt(r.get('wall_s'), '{:.0f}')} | {fmt(r.get('train_s'), '{:.0f}')} "
+            f"| {fmt(r.get('tokens_per_s'), '{:.0f}')} "
+            f"| {p['r']} | {p['lora_alpha']} | {p['lora_dropout']} | {float(p['learning_rate']):.2e} "
+            f"| {p['num_train_epochs']} | {','.join(p['target_modules'])} "
+            f"| [{Path(r['adapter_dir']).name}]({Path(r['adapter_dir']).name}) |"
+        )
+    (sweep_dir / "leaderboard.md").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--spec", required=True, help="JSON search spec (see module docstring)")
+    ap.add_argument("--data-files", default=DATA_FILES)
+    ap.add_argument("--sweep-dir", default=f"sweep_{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads-per-worker", type=int, default=0, help="0 = allowed CPUs // workers")
+    ap.add_argument("--logging-steps", type=int, default=10)
+    ap.add_argument("--prune-warmup-steps", type=int, default=20)
+    ap.add_argument("--prune-min-trials", type=int, default=2)
+    ap.add_argument("--no-prune", action="store_true")
+    args = ap.parse_args()
+
+    spec = json.loads(Path(args.spec).read_text(encoding="utf-8"))
+    trials = build_trials(spec)
+
+    sweep_dir = Path(args.sweep_dir)
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"[+] Model:  {MODEL_NAME}")
+    print(f"[+] Data:   {args.data_files}")
+    print(f"[+] Sweep:  {sweep_dir} ({len(trials)} trials, {args.workers} workers)")
+
+    data_dir = _prepare_data(args.data_files, sweep_dir)
+
+    # Only the CPUs this process may use (taskset / cgroup cpuset / container limits).
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    per = args.threads_per_worker or max(1, len(cores) // args.workers)
+    ctx = mp.get_context("spawn")
+    core_slots = ctx.Queue()
+    for w in range(args.workers):
+        core_slots.put(cores[(w * per) % len(cores):][:per] or cores[:per])
+
+    prune = {
+        "enabled": not args.no_prune,
+        "warmup_steps": args.prune_warmup_steps,
+        "min_trials": args.prune_min_trials,
+        "logging_steps": args.logging_steps,
+    }
+
+    results = []
+    with ctx.Manager() as manager:
+        reports = manager.dict()
+        with ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=ctx, initializer=_init_worker, initargs=(core_slots,)
+        ) as pool:
+            futures = [pool.submit(_run_trial, t, data_dir, str(sweep_dir), reports, prune) for t in trials]
+            for fut in as_completed(futures):
+                r = fut.result()
+                results.append(r)
+                print(f"[+] Trial {r['trial_id']} {r['status']} ({len(results)}/{len(trials)})")
+                _write_leaderboard(results, sweep_dir)
+
+    print(f"[✓] Leaderboard: {sweep_dir / 'leaderboard.md'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 import os
 import json
+import math
+import random
+import hashlib
+from datetime import datetime
 import torch
 from datasets import load_dataset, concatenate_datasets
 from transformers import (
@@ -9,7 +13,7 @@ from transformers import (
     Trainer,
     DataCollatorWithPadding,
 )
-from peft import LoraConfig, get_peft_model, TaskType
+from peft import LoraConfig, PeftModel, get_peft_model, TaskType
 
 MODEL_NAME = os.getenv("MODEL_NAME", "Qwen/Qwen2.5-3B-Instruct")
 DATA_FILES = os.getenv("DATA_FILES", "symoneural.json").strip()
@@ -17,6 +21,26 @@ OUT_DIR = os.getenv("OUT_DIR", "my_qwen_lora")
 SYM_STYLE = os.getenv("SYM_STYLE", "").strip()
 MAX_LEN = int(os.getenv("MAX_LEN", "512"))
 
+# LoRA / optimizer hyperparameters (defaults = baseline adapter)
+LORA_R = int(os.getenv("LORA_R", "8"))
+LORA_ALPHA = int(os.getenv("LORA_ALPHA", "16"))
+LORA_DROPOUT = float(os.getenv("LORA_DROPOUT", "0.05"))
+LORA_TARGETS = [x.strip() for x in os.getenv("LORA_TARGETS", "q_proj,k_proj,v_proj,o_proj").split(",") if x.strip()]
+LR = float(os.getenv("LR", "1e-4"))
+EPOCHS = float(os.getenv("EPOCHS", "1"))
+
+# Incremental training: continue an existing adapter on rows it has not seen.
+RESUME_ADAPTER = os.getenv("RESUME_ADAPTER", "").strip()
+# Files the resumed adapter was already trained on: seeds the seen set for adapters
+# that predate manifests, and always joins the replay pool (old rows need not be
+# repeated in DATA_FILES).
+SEEN_DATA_FILES = os.getenv("SEEN_DATA_FILES", "").strip()
+# Old rows replayed alongside new ones (as a fraction of new rows) to limit forgetting.
+REPLAY_RATIO = float(os.getenv("REPLAY_RATIO", "0.25"))
+REPLAY_SEED = int(os.getenv("REPLAY_SEED", "0"))
+
+MANIFEST_NAME = "data_manifest.json"
+
 
 def _write_tmp_jsonl(src_path: str, tmp_path: str) -> None:
     """
@@ -71,27 +95,75 @@ def _load_multi_dataset(files_csv: str):
     return ds_all
 
 
-def main():
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"[+] Device: {device}")
-    print(f"[+] Model:  {MODEL_NAME}")
-    print(f"[+] Data:   {DATA_FILES}")
-    print(f"[+] Out:    {OUT_DIR}")
+def row_hash(prompt: str, completion: str) -> str:
+    """Content hash of one training row (whitespace-stripped, same as preprocessing)."""
+    key = json.dumps({"prompt": prompt.strip(), "completion": completion.strip()}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
-    ds = _load_multi_dataset(DATA_FILES)
 
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, trust_remote_code=True, use_fast=True)
+def load_manifest(adapter_dir: str) -> dict:
+    """
+    Row-hash manifest saved next to an adapter. Returns {} if the adapter
+    predates manifests.
+    """
+    path = os.path.join(adapter_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir: str, seen: set, parent: dict, entry: dict) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {
+        "base_model": MODEL_NAME,
+        "rows": sorted(seen),
+        "history": list(parent.get("history", [])) + [entry],
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def select_incremental(ds, seen: set, replay_ratio: float = REPLAY_RATIO, seed: int = REPLAY_SEED):
+    """
+    Keep rows whose hash is not in `seen` (deduplicated), plus a random replay
+    sample of already-seen rows. Returns (dataset, row_hashes, n_new, n_replay).
+    """
+    hashes = [row_hash(p, c) for p, c in zip(ds["prompt"], ds["completion"])]
+
+    new_idx, old_idx, picked = [], [], set()
+    for i, h in enumerate(hashes):
+        if h in picked:
+            continue
+        picked.add(h)
+        (old_idx if h in seen else new_idx).append(i)
+
+    n_replay = min(len(old_idx), math.ceil(len(new_idx) * replay_ratio)) if new_idx else 0
+    replay_idx = random.Random(seed).sample(old_idx, n_replay)
+
+    return ds.select(sorted(new_idx + replay_idx)), set(hashes), len(new_idx), n_replay
+
+
+def load_tokenizer(model_name: str = MODEL_NAME):
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True, use_fast=True)
 
     if tokenizer.pad_token_id is None:
         tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
 
+
+def tokenize_dataset(ds, tokenizer, sym_style: str = SYM_STYLE, max_len: int = MAX_LEN):
+    """
+    prompt/completion rows -> input_ids / attention_mask / labels
+    (prompt tokens masked with -100 so loss is on the assistant answer only).
+    """
     def preprocess(ex):
         user_prompt = ex["prompt"].strip()
         assistant_answer = ex["completion"].strip()
 
         msgs_prompt = []
-        if SYM_STYLE:
-            msgs_prompt.append({"role": "system", "content": SYM_STYLE})
+        if sym_style:
+            msgs_prompt.append({"role": "system", "content": sym_style})
         msgs_prompt.append({"role": "user", "content": user_prompt})
 
         prompt_text = tokenizer.apply_chat_template(
@@ -107,8 +179,8 @@ def main():
             add_generation_prompt=False
         )
 
-        prompt_tok = tokenizer(prompt_text, truncation=True, max_length=MAX_LEN, padding=False)
-        full_tok = tokenizer(full_text, truncation=True, max_length=MAX_LEN, padding=False)
+        prompt_tok = tokenizer(prompt_text, truncation=True, max_length=max_len, padding=False)
+        full_tok = tokenizer(full_text, truncation=True, max_length=max_len, padding=False)
 
         input_ids = full_tok["input_ids"]
         attention_mask = full_tok["attention_mask"]
@@ -123,46 +195,114 @@ def main():
             "labels": labels,
         }
 
-    ds = ds.map(preprocess, remove_columns=ds.column_names)
+    return ds.map(preprocess, remove_columns=ds.column_names)
 
-    model = AutoModelForCausalLM.from_pretrained(
-        MODEL_NAME,
+
+def load_base_model(device: str, model_name: str = MODEL_NAME):
+    return AutoModelForCausalLM.from_pretrained(
+        model_name,
         trust_remote_code=True,
         torch_dtype=torch.float16 if device == "cuda" else torch.float32,
         device_map="auto" if device == "cuda" else None,
     )
 
-    lora = LoraConfig(
+
+def build_lora_config(
+    r: int = LORA_R,
+    lora_alpha: int = LORA_ALPHA,
+    lora_dropout: float = LORA_DROPOUT,
+    target_modules=None,
+) -> LoraConfig:
+    return LoraConfig(
         task_type=TaskType.CAUSAL_LM,
-        r=8,
-        lora_alpha=16,
-        lora_dropout=0.05,
-        target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+        r=r,
+        lora_alpha=lora_alpha,
+        lora_dropout=lora_dropout,
+        target_modules=list(target_modules or LORA_TARGETS),
     )
-    model = get_peft_model(model, lora)
 
-    data_collator = DataCollatorWithPadding(
-        tokenizer=tokenizer,
-        padding=True,
-        return_tensors="pt",
-    )
 
-    args = TrainingArguments(
-        output_dir=OUT_DIR,
-        num_train_epochs=1,
+def build_training_args(
+    out_dir: str,
+    device: str,
+    learning_rate: float = LR,
+    num_train_epochs: float = EPOCHS,
+    **overrides,
+) -> TrainingArguments:
+    kwargs = dict(
+        output_dir=out_dir,
+        num_train_epochs=num_train_epochs,
         per_device_train_batch_size=1,
         gradient_accumulation_steps=4,
-        learning_rate=1e-4,
+        learning_rate=learning_rate,
         logging_steps=10,
         save_strategy="epoch",
         fp16=(device == "cuda"),
         report_to="none",
         remove_unused_columns=False,
     )
+    kwargs.update(overrides)
+    return TrainingArguments(**kwargs)
+
+
+def main():
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"[+] Device: {device}")
+    print(f"[+] Model:  {MODEL_NAME}")
+    print(f"[+] Data:   {DATA_FILES}")
+    print(f"[+] Out:    {OUT_DIR}")
+
+    ds = _load_multi_dataset(DATA_FILES)
+
+    parent = {}
+    seen = set()
+    if RESUME_ADAPTER:
+        if os.path.abspath(RESUME_ADAPTER) == os.path.abspath(OUT_DIR):
+            raise SystemExit("OUT_DIR must differ from RESUME_ADAPTER (baselines are never overwritten)")
+
+        parent = load_manifest(RESUME_ADAPTER)
+        seen = set(parent.get("rows", []))
+        if SEEN_DATA_FILES:
+            old = _load_multi_dataset(SEEN_DATA_FILES)
+            seen |= {row_hash(p, c) for p, c in zip(old["prompt"], old["completion"])}
+            ds = concatenate_datasets([ds, old])  # replay pool; duplicates dropped below
+        elif not parent:
+            print(f"[!] {RESUME_ADAPTER} has no {MANIFEST_NAME}; set SEEN_DATA_FILES or every row counts as new")
+
+        total = len(ds)
+        ds, row_hashes, n_new, n_replay = select_incremental(ds, seen)
+        print(f"[+] Resume: {RESUME_ADAPTER}")
+        print(f"[+] Rows:   {total} candidate, {n_new} new, {n_replay} replayed")
+        if n_new and n_replay == 0 and REPLAY_RATIO > 0:
+            print(
+                "[!] No old rows available to replay (manifests store hashes, not text); "
+                "include old files in DATA_FILES or set SEEN_DATA_FILES"
+            )
+        if n_new == 0:
+            print("[✓] No new rows; nothing to train")
+            return
+    else:
+        row_hashes = {row_hash(p, c) for p, c in zip(ds["prompt"], ds["completion"])}
+        n_new, n_replay = len(row_hashes), 0
+
+    tokenizer = load_tokenizer()
+    ds = tokenize_dataset(ds, tokenizer)
+
+    model = load_base_model(device)
+    if RESUME_ADAPTER:
+        model = PeftModel.from_pretrained(model, RESUME_ADAPTER, is_trainable=True)
+    else:
+        model = get_peft_model(model, build_lora_config())
+
+    data_collator = DataCollatorWithPadding(
+        tokenizer=tokenizer,
+        padding=True,
+        return_tensors="pt",
+    )
 
     trainer = Trainer(
         model=model,
-        args=args,
+        args=build_training_args(OUT_DIR, device),
         train_dataset=ds,
         data_collator=data_collator,
     )
@@ -170,8 +310,20 @@ def main():
     trainer.train()
     trainer.save_model(OUT_DIR)
     tokenizer.save_pretrained(OUT_DIR)
+    save_manifest(
+        OUT_DIR,
+        seen | row_hashes,
+        parent,
+        {
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "parent_adapter": RESUME_ADAPTER or None,
+            "data_files": DATA_FILES,
+            "new_rows": n_new,
+            "replay_rows": n_replay,
+        },
+    )
     print("[✓] Training complete")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,6 +3,9 @@ from __future__ import annotations
 
 import os
 import re
+import json
+import time
+import threading
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
@@ -16,11 +19,18 @@ OUT_DIR = Path(os.environ.get("SYM_OUT_DIR", str(REPO_ROOT / "outputs" / "images
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 DEFAULT_MODEL = os.environ.get("SYM_SD_MODEL", "runwayml/stable-diffusion-v1-5")
+# Local safetensors snapshot written by diffusion/snapshot.py; takes precedence over SYM_SD_MODEL.
+DEFAULT_SNAPSHOT_DIR = os.environ.get("SYM_SD_SNAPSHOT_DIR", "").strip()
+SNAPSHOT_META = "symoneural_snapshot.json"
 
 _PIPE = None
 _DEVICE = None
 
 
+class GenerationCancelled(RuntimeError):
+    """Raised from inside the denoising loop when the caller cancels or the deadline passes."""
+
+
 def _slug(s: str) -> str:
     s = s.strip().lower()
     s = re.sub(r"[^a-z0-9]+", "_", s)
@@ -41,11 +51,34 @@ def _load_pipe_once(model_id: str, device: str):
         return _PIPE
 
     dtype = torch.float16 if device == "cuda" else torch.float32
+    t0 = time.perf_counter()
+
+    # The snapshot stands in for the default model only; an explicit model_id wins.
+    if DEFAULT_SNAPSHOT_DIR:
+        if model_id == DEFAULT_MODEL:
+            model_id = DEFAULT_SNAPSHOT_DIR
+        else:
+            print(f"[!] Ignoring SYM_SD_SNAPSHOT_DIR={DEFAULT_SNAPSHOT_DIR}: model {model_id} given explicitly")
+
+    # A diffusion/snapshot.py dir loads from safetensors only. It is mmapped as-is
+    # when written in this device's dtype; otherwise the device dtype still wins.
+    meta_path = Path(model_id) / SNAPSHOT_META
+    snapshot = meta_path.is_file()
+    if snapshot:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if getattr(torch, meta["dtype"]) != dtype:
+            print(
+                f"[!] Snapshot {model_id} is {meta['dtype']} (exported for {meta.get('device', '?')}); "
+                f"converting to {str(dtype).replace('torch.', '')} for {device}. "
+                f"Re-export with --device {device} to load it without a copy."
+            )
 
     pipe = StableDiffusionPipeline.from_pretrained(
         model_id,
         torch_dtype=dtype,
         safety_checker=None,  # keep simple for local dev; can re-enable later
+        low_cpu_mem_usage=True,
+        use_safetensors=True if snapshot else None,
     )
 
     if device == "cuda":
@@ -58,6 +91,8 @@ def _load_pipe_once(model_id: str, device: str):
     else:
         pipe = pipe.to("cpu")
 
+    print(f"[+] Diffusion pipeline loaded from {model_id} in {time.perf_counter() - t0:.2f}s")
+
     _PIPE = pipe
     _DEVICE = device
     return _PIPE
@@ -73,9 +108,14 @@ def generate_image(
     width: int = 512,
     height: int = 512,
     seed: Optional[int] = None,
+    cancel_event: Optional[threading.Event] = None,
+    deadline: Optional[float] = None,
 ) -> str:
     """
     Generate an image and return the saved file path (string).
+
+    cancel_event / deadline (time.monotonic()) interrupt the denoising loop
+    between steps by raising GenerationCancelled; nothing is saved.
     """
     prompt = (prompt or "").strip()
     if not prompt:
@@ -92,6 +132,16 @@ def generate_image(
     fname = f"symoneural_{ts}_{_slug(prompt)}.png"
     out_path = OUT_DIR / fname
 
+    def _interrupt(_pipe, step, timestep, callback_kwargs):
+        # Raise instead of setting pipe._interrupt: the pipe is shared across requests.
+        if cancel_event is not None and cancel_event.is_set():
+            raise GenerationCancelled(f"cancelled at step {step}")
+        if deadline is not None and time.monotonic() >= deadline:
+            raise GenerationCancelled(f"deadline exceeded at step {step}")
+        return callback_kwargs
+
+    callback = _interrupt if (cancel_event is not None or deadline is not None) else None
+
     result = pipe(
         prompt=prompt,
         num_inference_steps=int(steps),
@@ -99,6 +149,7 @@ def generate_image(
         width=int(width),
         height=int(height),
         generator=gen,
+        callback_on_step_end=callback,
     )
 
     image = result.images[0]
@@ -0,0 +1,105 @@
+# diffusion/snapshot.py
+"""
+Write a local safetensors snapshot of the Stable Diffusion pipeline in the
+dtype the runtime uses on the target device (float16 on cuda, float32 on cpu).
+Point SYM_SD_SNAPSHOT_DIR at it to use it.
+
+  python -m diffusion.snapshot --out snapshots/sd15 --device cuda
+"""
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime
+
+import torch
+from diffusers import StableDiffusionPipeline
+
+from diffusion.pipeline import REPO_ROOT, DEFAULT_MODEL, SNAPSHOT_META
+
+
+def _runtime_dtype(device: str) -> str:
+    """What diffusion/pipeline.py loads on this device."""
+    return "float16" if device == "cuda" else "float32"
+
+
+def _time_load(path: str, device: str) -> float:
+    """Load the way the runtime does on `device` (its dtype; safetensors only for snapshots)."""
+    t0 = time.perf_counter()
+    StableDiffusionPipeline.from_pretrained(
+        path,
+        torch_dtype=getattr(torch, _runtime_dtype(device)),
+        safety_checker=None,
+        low_cpu_mem_usage=True,
+        use_safetensors=os.path.isfile(os.path.join(path, SNAPSHOT_META)) or None,
+    )
+    return time.perf_counter() - t0
+
+
+def _time_load_subprocess(path: str, device: str) -> float:
+    """Fresh interpreter, so nothing is cached in-process."""
+    res = subprocess.run(
+        [sys.executable, "-m", "diffusion.snapshot", "--time-load", path, "--device", device],
+        cwd=str(REPO_ROOT),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(res.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=DEFAULT_MODEL)
+    ap.add_argument("--out", default=str(REPO_ROOT / "snapshots" / "sd"))
+    ap.add_argument("--device", default="cpu", choices=["cpu", "cuda"], help="device the snapshot is for")
+    ap.add_argument(
+        "--dtype",
+        default=None,
+        choices=["float32", "float16", "bfloat16"],
+        help="default: the runtime dtype for --device (cuda float16, cpu float32)",
+    )
+    ap.add_argument("--time-load", default=None, metavar="DIR", help="load a model / snapshot, print seconds")
+    args = ap.parse_args()
+
+    if args.time_load:
+        print(f"{_time_load(args.time_load, args.device):.3f}")
+        return
+
+    dtype = args.dtype or _runtime_dtype(args.device)
+    if dtype != _runtime_dtype(args.device):
+        print(f"[!] {args.device} runs in {_runtime_dtype(args.device)}; this snapshot will be converted at load")
+
+    # Both measured the way the runtime loads on --device, in fresh interpreters.
+    model = os.path.abspath(args.model) if os.path.exists(args.model) else args.model
+    before = _time_load_subprocess(model, args.device)
+
+    pipe = StableDiffusionPipeline.from_pretrained(
+        args.model,
+        torch_dtype=getattr(torch, dtype),
+        safety_checker=None,
+    )
+    pipe.save_pretrained(args.out, safe_serialization=True)
+    del pipe
+    meta = {
+        "model": args.model,
+        "dtype": dtype,
+        "device": args.device,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    with open(os.path.join(args.out, SNAPSHOT_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    after = _time_load_subprocess(os.path.abspath(args.out), args.device)
+
+    print(f"[+] Cold start before ({args.model}): {before:.2f}s")
+    print(f"[+] Cold start after  (mmap snapshot): {after:.2f}s")
+    print(f"[✓] Snapshot written. Use: SYM_SD_SNAPSHOT_DIR={os.path.abspath(args.out)}")
+
+
+if __name__ == "__main__":
+    main()